@@ -10,6 +10,7 @@ from .main import (
     generate_context_file,
     scan_codebase,
     estimate_tokens,
+    FileInfo,
     CODE_EXTENSIONS,
     SKIP_DIRS,
     SKIP_FILES
@@ -19,6 +20,7 @@ __all__ = [
     'generate_context_file',
     'scan_codebase',
     'estimate_tokens',
+    'FileInfo',
     'CODE_EXTENSIONS',
     'SKIP_DIRS',
     'SKIP_FILES'
@@ -5,8 +5,18 @@ Main module - contains all the core functionality
 """
 
 import os
+import re
 import sys
+import stat
+import fnmatch
+import heapq
+import json
+import hashlib
+from collections import Counter
+from bisect import bisect_right
+from itertools import accumulate, chain
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import argparse
 
@@ -34,195 +44,452 @@ SKIP_FILES = {
     'package-lock.json', 'yarn.lock', 'poetry.lock', 'Pipfile.lock'
 }
 
+# Lowercased once so per-file checks need no normalization
+CODE_EXTENSIONS_LOWER = frozenset(ext.lower() for ext in CODE_EXTENSIONS)
+
+# Wildcard entries in SKIP_DIRS, compiled into a single regex
+_WILDCARD_DIR_PATTERNS = [fnmatch.translate(d) for d in SKIP_DIRS if '*' in d]
+_WILDCARD_RE = re.compile('|'.join(_WILDCARD_DIR_PATTERNS)) if _WILDCARD_DIR_PATTERNS else None
+
+# Separator line between output sections
+_SEP = '=' * 80
+
+# Header written before each file's raw bytes, filled in with str.format
+_HEADER_FMT = (
+    f"\n{_SEP}\n"
+    "FILE: {path}\n"
+    "Lines: {lines} | Tokens: ~{tokens}\n"
+    f"{_SEP}\n\n"
+)
+
+# Large output buffer so the per-file writes rarely hit the disk
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Selected files are read in chunks of this size, never whole
+_CHUNK_SIZE = 64 * 1024
+
+# Files stat'ed per thread-pool task in the metadata pass
+STAT_BATCH_SIZE = 256
+
+# Bump when the on-disk cache layout changes
+CACHE_VERSION = 1
+
+def is_skipped_dir(name):
+    """Check a directory name against SKIP_DIRS, honoring wildcards"""
+    if name in SKIP_DIRS:
+        return True
+    return _WILDCARD_RE is not None and _WILDCARD_RE.match(name) is not None
+
 def estimate_tokens(text):
     """Rough estimate: 1 token ≈ 4 characters"""
     return len(text) // 4
 
-def get_file_info(filepath):
-    """Get file size and line count"""
+class FileInfo:
+    """Metadata for one scanned file; lines are counted once it is selected"""
+    # Slots instead of a per-file dict keep large scans compact
+    __slots__ = ('path_str', 'full_path', 'ext', 'size', 'tokens',
+                 'mtime_ns', 'lines')
+
+    def __init__(self, path_str, full_path, size, tokens, mtime_ns=None):
+        self.path_str = path_str
+        # Same rule as the walker: a leading dot is not an extension
+        name = os.path.basename(path_str)
+        dot = name.rfind('.')
+        self.ext = name[dot:] if dot > 0 else ''
+        self.full_path = full_path
+        self.size = size
+        self.tokens = tokens
+        self.mtime_ns = mtime_ns
+        self.lines = None
+
+    @property
+    def path(self):
+        """Relative path as a Path, built on demand rather than per scan"""
+        return Path(self.path_str)
+
+def get_file_metadata(filepath):
+    """Get file size, token estimate and mtime without reading the file"""
     try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-            lines = content.count('\n') + 1
-            tokens = estimate_tokens(content)
-            return {
-                'size': len(content),
-                'lines': lines,
-                'tokens': tokens,
-                'content': content
-            }
-    except Exception as e:
+        st = os.stat(filepath)
+    except OSError:
         return None
+    # Skip sockets, fifos, dangling links, etc.
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return st.st_size, st.st_size // 4, st.st_mtime_ns
 
-def should_include_file(filepath, custom_extensions=None):
-    """Determine if file should be included"""
-    path = Path(filepath)
-    
-    # Skip if in skip list
-    if path.name in SKIP_FILES:
+def get_cache_path(root_path):
+    """Cache file for a codebase, keyed by its absolute path"""
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    digest = hashlib.sha1(os.path.abspath(root_path).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, 'codebase-context', f"{digest}.json")
+
+def load_cache(root_path):
+    """Load cached {relative_path: [mtime_ns, size, lines]} from a previous run"""
+    try:
+        with open(get_cache_path(root_path), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+        return {}
+    files = data.get('files')
+    if not isinstance(files, dict):
+        return {}
+    # Entries of any other shape are dropped, i.e. treated as misses
+    return {
+        path: entry for path, entry in files.items()
+        if isinstance(entry, list) and len(entry) == 3
+        and all(type(value) is int for value in entry)
+    }
+
+def save_cache(root_path, files):
+    """Persist line counts for the next run; failures are not fatal"""
+    cache_path = get_cache_path(root_path)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'files': files}, f)
+        # Swap in atomically so a concurrent run never reads half a file
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+def count_lines(file_info):
+    """Fill in a selected file's exact line count; False if it can't be read"""
+    # A final line without a trailing newline still counts, an empty
+    # file has none
+    newlines, last = 0, b''
+    try:
+        with open(file_info.full_path, 'rb') as f:
+            while True:
+                chunk = f.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                newlines += chunk.count(b'\n')
+                last = chunk[-1:]
+    except OSError:
+        # Unreadable or gone since the scan; the caller drops it
         return False
-    
-    # Check extension
-    extensions = custom_extensions if custom_extensions else CODE_EXTENSIONS
-    return path.suffix.lower() in extensions or path.suffix == ''
+    file_info.lines = newlines + (1 if last and last != b'\n' else 0)
+    return True
+
+def is_readable(file_info):
+    """Check a selected file can still be opened, without reading it"""
+    try:
+        with open(file_info.full_path, 'rb'):
+            return True
+    except OSError:
+        return False
+
+def copy_file_into(out, src):
+    """Append an open source file's bytes to the binary output as-is"""
+    # Only trouble reading the source is tolerated here; a failing write
+    # to the output (disk full, I/O error) propagates to the caller
+    offset = 0
+    if hasattr(os, 'sendfile'):
+        # Anything still buffered must land before sendfile writes
+        out.flush()
+        try:
+            size = os.fstat(src.fileno()).st_size
+            while offset < size:
+                sent = os.sendfile(out.fileno(), src.fileno(), offset,
+                                   size - offset)
+                if not sent:
+                    break
+                offset += sent
+            return
+        except OSError:
+            # Some platforms only sendfile to sockets; finish with a plain
+            # copy from wherever sendfile stopped. If the output was at
+            # fault, the write below raises it again
+            src.seek(offset)
+    while True:
+        try:
+            chunk = src.read(_CHUNK_SIZE)
+        except OSError:
+            # Source went bad mid-file; keep what was copied
+            break
+        if not chunk:
+            break
+        out.write(chunk)
+
+def write_content(out, file_info):
+    """Write one file's section to the binary output"""
+    # Open before the header goes out, so a file that vanished since it
+    # was checked gets no empty section
+    try:
+        src = open(file_info.full_path, 'rb')
+    except OSError:
+        return
+    with src:
+        out.write(_HEADER_FMT.format(
+            path=file_info.path_str,
+            lines=file_info.lines,
+            tokens=file_info.tokens
+        ).encode('utf-8'))
+        copy_file_into(out, src)
+    out.write(b"\n\n")
 
-def scan_codebase(root_path, max_tokens=100000, custom_extensions=None):
-    """Scan codebase and collect files with metadata"""
-    root = Path(root_path)
+def get_metadata_batch(paths):
+    """get_file_metadata over a slice of paths, as one thread-pool task"""
+    return [get_file_metadata(path) for path in paths]
+
+def default_jobs():
+    """Worker threads for the metadata pass; stat calls are I/O bound"""
+    return min(32, (os.cpu_count() or 1) * 4)
+
+def walk_code_files(root, ext_set=CODE_EXTENSIONS_LOWER):
+    """Yield (full_path, relative_path) for every code file under root"""
+    # Hot loop: bind everything the walk touches to locals up front
+    join = os.path.join
+    skipped_dir = is_skipped_dir
+    skip_files = SKIP_FILES
+    # os.walk joins paths onto root, so every path under it starts with
+    # this prefix and relpath() is unnecessary
+    prefix_len = len(join(root, ''))
+
+    for dirpath, dirs, files in os.walk(root, followlinks=False):
+        # Prune excluded directories in place so os.walk never lists them
+        dirs[:] = [d for d in dirs if not skipped_dir(d)]
+
+        for name in files:
+            # Files named like a skipped directory (".env", "build", ...)
+            # stay excluded, as they were when SKIP_DIRS was matched
+            # against every path part
+            if name in skip_files or skipped_dir(name):
+                continue
+            # Skip if not a code file; no extension means included, and a
+            # leading dot (".bashrc") is not an extension
+            dot = name.rfind('.')
+            if dot > 0 and name[dot:].lower() not in ext_set:
+                continue
+
+            full_path = join(dirpath, name)
+            yield full_path, full_path[prefix_len:]
+
+def scan_codebase(root_path, max_tokens=100000, custom_extensions=None,
+                  jobs=None, cache=None, exclude=None):
+    """Scan codebase and collect files with metadata
+
+    cache maps relative paths to [mtime_ns, size, lines] from load_cache;
+    files whose mtime and size still match get their line count from it.
+    exclude is a set of relative paths to leave out, e.g. the output file.
+    Returns (files_data, total_tokens, oversized), where oversized counts
+    files left out because they alone exceed max_tokens; total_tokens
+    includes them.
+    """
+    root = os.fspath(root_path)
     files_data = []
     total_tokens = 0
-    
-    for filepath in root.rglob('*'):
-        # Skip directories
-        if filepath.is_dir():
-            continue
-        
-        # Skip if in excluded directory
-        if any(skip_dir in filepath.parts for skip_dir in SKIP_DIRS):
-            continue
-        
-        # Skip if not a code file
-        if not should_include_file(filepath, custom_extensions):
-            continue
-        
-        # Get file info
-        info = get_file_info(filepath)
+    oversized = 0
+
+    if custom_extensions:
+        ext_set = frozenset(ext.lower() for ext in custom_extensions)
+    else:
+        ext_set = CODE_EXTENSIONS_LOWER
+
+    candidates = list(walk_code_files(root, ext_set))
+    if exclude:
+        candidates = [c for c in candidates if c[1] not in exclude]
+    paths = [full_path for full_path, _ in candidates]
+
+    # Get file info, overlapping the stat calls across threads; a single
+    # stat is far cheaper than a Future, so each task takes a whole batch
+    if jobs is None:
+        jobs = default_jobs()
+    if jobs > 1 and len(paths) > STAT_BATCH_SIZE:
+        batches = [paths[i:i + STAT_BATCH_SIZE]
+                   for i in range(0, len(paths), STAT_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=min(jobs, len(batches))) as executor:
+            infos = list(chain.from_iterable(
+                executor.map(get_metadata_batch, batches)))
+    else:
+        infos = map(get_file_metadata, paths)
+
+    for (full_path, relative_path), info in zip(candidates, infos):
         if not info:
             continue
-        
-        relative_path = filepath.relative_to(root)
-        files_data.append({
-            'path': relative_path,
-            'full_path': filepath,
-            **info
-        })
-        total_tokens += info['tokens']
+
+        size, tokens, mtime_ns = info
+        total_tokens += tokens
+        # A file that alone exceeds the budget can never be selected
+        if tokens > max_tokens:
+            oversized += 1
+            continue
+        file_info = FileInfo(relative_path, full_path, size, tokens, mtime_ns)
+        if cache:
+            cached = cache.get(relative_path)
+            if cached and cached[0] == mtime_ns and cached[1] == size:
+                file_info.lines = cached[2]
+        files_data.append(file_info)
     
     # Sort by importance (prioritize smaller, core files)
-    files_data.sort(key=lambda x: (x['tokens'], str(x['path'])))
+    files_data.sort(key=lambda x: (x.tokens, x.path_str))
     
-    return files_data, total_tokens
+    return files_data, total_tokens, oversized
 
 def generate_tree_structure(root_path, files_data):
     """Generate visual tree structure of included files"""
-    tree_lines = [f"📁 {Path(root_path).name}/"]
-    
-    # Group by directory
-    dirs = {}
+    # Build a trie of path parts; files are leaves mapped to None
+    tree = {}
     for file_info in files_data:
-        parts = file_info['path'].parts
-        if len(parts) > 1:
-            dir_name = parts[0]
-            if dir_name not in dirs:
-                dirs[dir_name] = []
-            dirs[dir_name].append(file_info)
-        else:
-            tree_lines.append(f"├── {file_info['path'].name}")
-    
-    for dir_name, files in dirs.items():
-        tree_lines.append(f"├── 📁 {dir_name}/")
-        for f in files:
-            tree_lines.append(f"│   ├── {f['path'].name}")
-    
-    return '\n'.join(tree_lines)
+        *dir_parts, name = Path(file_info.path_str).parts
+        node = tree
+        for part in dir_parts:
+            node = node.setdefault(part, {})
+        node[name] = None
+
+    def walk(node, indent):
+        # Files first, then subdirectories, at every level
+        for name, child in node.items():
+            if child is None:
+                yield f"{indent}├── {name}"
+        for name, child in node.items():
+            if child is not None:
+                yield f"{indent}├── 📁 {name}/"
+                yield from walk(child, indent + "│   ")
+
+    header = f"📁 {Path(root_path).name}/"
+    return '\n'.join(chain((header,), walk(tree, '')))
 
 def generate_summary(files_data, total_tokens):
     """Generate codebase summary"""
     summary = []
-    summary.append("=" * 80)
+    summary.append(_SEP)
     summary.append("CODEBASE SUMMARY")
-    summary.append("=" * 80)
+    summary.append(_SEP)
     summary.append(f"Total Files: {len(files_data)}")
-    summary.append(f"Total Lines: {sum(f['lines'] for f in files_data):,}")
+    summary.append(f"Total Lines: {sum(f.lines for f in files_data):,}")
     summary.append(f"Total Tokens (estimated): {total_tokens:,}")
-    summary.append(f"Total Size: {sum(f['size'] for f in files_data) / 1024:.2f} KB")
+    summary.append(f"Total Size: {sum(f.size for f in files_data) / 1024:.2f} KB")
     summary.append("")
     
     # File type breakdown
-    extensions = {}
-    for f in files_data:
-        ext = f['path'].suffix or 'no extension'
-        extensions[ext] = extensions.get(ext, 0) + 1
+    extensions = Counter(f.ext or 'no extension' for f in files_data)
     
     summary.append("File Types:")
-    for ext, count in sorted(extensions.items(), key=lambda x: x[1], reverse=True):
+    for ext, count in extensions.most_common():
         summary.append(f"  {ext}: {count} files")
     
     summary.append("")
     summary.append("Largest Files:")
-    largest = sorted(files_data, key=lambda x: x['tokens'], reverse=True)[:5]
+    largest = heapq.nlargest(5, files_data, key=lambda x: x.tokens)
     for f in largest:
-        summary.append(f"  {f['path']} - {f['lines']} lines, ~{f['tokens']:,} tokens")
+        summary.append(f"  {f.path_str} - {f.lines} lines, ~{f.tokens:,} tokens")
     
-    summary.append("=" * 80)
+    summary.append(_SEP)
     summary.append("")
     
     return '\n'.join(summary)
 
+def relative_output_path(root_path, output_file):
+    """Output file's path relative to root_path, or None if outside it"""
+    try:
+        rel = os.path.relpath(os.path.realpath(output_file),
+                              os.path.realpath(root_path))
+    except ValueError:
+        # Different drive on Windows
+        return None
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        return None
+    return rel
+
+def select_within_budget(files_data, max_tokens):
+    """Take the longest prefix of files_data that fits in max_tokens"""
+    # Token counts are non-negative, so the running total is sorted and
+    # the cut-off point is a binary search away
+    cumulative = list(accumulate(f.tokens for f in files_data))
+    count = bisect_right(cumulative, max_tokens)
+    running_tokens = cumulative[count - 1] if count else 0
+    return files_data[:count], running_tokens
+
 def generate_context_file(root_path, output_file, max_tokens=100000, 
                          include_tree=True, custom_extensions=None,
-                         priority_files=None):
+                         priority_files=None, jobs=None, use_cache=True):
     """Generate the complete context file"""
     
     print(f"🔍 Scanning codebase at: {root_path}")
-    files_data, total_tokens = scan_codebase(root_path, max_tokens, custom_extensions)
+    cache = load_cache(root_path) if use_cache else None
+    # A previous run's output inside the root must not be fed back in;
+    # it is truncated before the file contents are copied
+    output_rel = relative_output_path(root_path, output_file)
+    exclude = {output_rel} if output_rel else None
+    files_data, total_tokens, oversized = scan_codebase(
+        root_path, max_tokens, custom_extensions, jobs, cache, exclude)
+    found = len(files_data) + oversized
     
-    print(f"📊 Found {len(files_data)} files (~{total_tokens:,} tokens)")
-    
-    # Apply token limit if needed
-    selected_files = []
-    running_tokens = 0
+    print(f"📊 Found {found} files (~{total_tokens:,} tokens)")
     
     # Prioritize specific files if provided
     if priority_files:
         priority_set = set(priority_files)
-        priority_data = [f for f in files_data if str(f['path']) in priority_set]
-        other_data = [f for f in files_data if str(f['path']) not in priority_set]
+        priority_data, other_data = [], []
+        for f in files_data:
+            (priority_data if f.path_str in priority_set else other_data).append(f)
         files_data = priority_data + other_data
     
-    for file_info in files_data:
-        if running_tokens + file_info['tokens'] > max_tokens:
-            print(f"⚠️  Reached token limit. Including {len(selected_files)}/{len(files_data)} files")
-            break
-        selected_files.append(file_info)
-        running_tokens += file_info['tokens']
+    # Apply token limit if needed
+    selected_files, running_tokens = select_within_budget(files_data, max_tokens)
+    if len(selected_files) < found:
+        print(f"⚠️  Reached token limit. Including {len(selected_files)}/{found} files")
+
+    # Only the files that made the budget, and missed the cache, are read;
+    # cache hits are still opened to make sure they can be copied
+    unreadable = {f for f in selected_files
+                  if not (count_lines(f) if f.lines is None else is_readable(f))}
+    if unreadable:
+        # Leave them out entirely, as if the scan had never found them
+        selected_files = [f for f in selected_files if f not in unreadable]
+        files_data = [f for f in files_data if f not in unreadable]
+        found -= len(unreadable)
+        running_tokens = sum(f.tokens for f in selected_files)
+
+    if use_cache:
+        # Rebuilt from this scan, so deleted or changed files drop out
+        save_cache(root_path, {
+            f.path_str: [f.mtime_ns, f.size, f.lines]
+            for f in files_data if f.lines is not None
+        })
+
+    # Everything ahead of the file contents is text, encoded in one go
+    preamble = []
+    
+    # Header
+    preamble.append(f"# CODEBASE CONTEXT FOR LLM\n")
+    preamble.append(f"# Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    preamble.append(f"# Root: {root_path}\n")
+    preamble.append(f"# Token Budget: {max_tokens:,}\n")
+    preamble.append(f"# Actual Tokens: ~{running_tokens:,}\n\n")
     
-    # Generate output
-    with open(output_file, 'w', encoding='utf-8') as out:
-        # Header
-        out.write(f"# CODEBASE CONTEXT FOR LLM\n")
-        out.write(f"# Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        out.write(f"# Root: {root_path}\n")
-        out.write(f"# Token Budget: {max_tokens:,}\n")
-        out.write(f"# Actual Tokens: ~{running_tokens:,}\n\n")
-        
-        # Summary
-        out.write(generate_summary(selected_files, running_tokens))
-        
-        # Tree structure
-        if include_tree:
-            out.write("\nPROJECT STRUCTURE:\n")
-            out.write(generate_tree_structure(root_path, selected_files))
-            out.write("\n\n")
-        
-        # File contents
-        out.write("=" * 80 + "\n")
-        out.write("FILE CONTENTS\n")
-        out.write("=" * 80 + "\n\n")
-        
+    # Summary
+    preamble.append(generate_summary(selected_files, running_tokens))
+    
+    # Tree structure
+    if include_tree:
+        preamble.append("\nPROJECT STRUCTURE:\n")
+        preamble.append(generate_tree_structure(root_path, selected_files))
+        preamble.append("\n\n")
+    
+    # File contents
+    preamble.append(f"{_SEP}\nFILE CONTENTS\n{_SEP}\n\n")
+    
+    # Generate output; file contents are copied through as raw bytes
+    with open(output_file, 'wb', buffering=OUTPUT_BUFFER_SIZE) as out:
+        out.write(''.join(preamble).encode('utf-8'))
         for file_info in selected_files:
-            out.write(f"\n{'='*80}\n")
-            out.write(f"FILE: {file_info['path']}\n")
-            out.write(f"Lines: {file_info['lines']} | Tokens: ~{file_info['tokens']}\n")
-            out.write(f"{'='*80}\n\n")
-            out.write(file_info['content'])
-            out.write("\n\n")
+            write_content(out, file_info)
     
     print(f"✅ Context file generated: {output_file}")
     print(f"📝 Included {len(selected_files)} files with ~{running_tokens:,} tokens")
     
-    if len(selected_files) < len(files_data):
-        print(f"\n⚠️  {len(files_data) - len(selected_files)} files were excluded due to token limit")
+    if len(selected_files) < found:
+        print(f"\n⚠️  {found - len(selected_files)} files were excluded due to token limit")
         print("💡 Consider increasing --max-tokens or using --priority to include specific files")
 
 def main():
@@ -270,6 +537,17 @@ Examples:
         nargs='+',
         help='Priority files to include first (relative paths)'
     )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=None,
+        help='Worker threads for scanning file metadata (default: auto)'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not read or write the line-count cache between runs'
+    )
     parser.add_argument(
         '--version',
         action='version',
@@ -279,7 +557,7 @@ Examples:
     args = parser.parse_args()
     
     # Convert extensions to set
-    custom_ext = set(args.extensions) if args.extensions else None
+    custom_ext = frozenset(args.extensions) if args.extensions else None
     
     # Validate path
     if not os.path.exists(args.path):
@@ -294,7 +572,9 @@ Examples:
             max_tokens=args.max_tokens,
             include_tree=not args.no_tree,
             custom_extensions=custom_ext,
-            priority_files=args.priority
+            priority_files=args.priority,
+            jobs=args.jobs,
+            use_cache=not args.no_cache
         )
     except KeyboardInterrupt:
         print("\n\n⚠️  Operation cancelled by user")